@@ -1,9 +1,18 @@
 import os
 import sys
 import io
-import base64
+import pathlib
+import binascii
+import hashlib
 import time
 import logging
+import threading
+import queue
+import itertools
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
 import numpy as np
 from PIL import Image
 from flask import Flask, request, jsonify
@@ -11,9 +20,43 @@ from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import torch
 
-import pathlib
-temp = pathlib.PosixPath
-pathlib.PosixPath = pathlib.WindowsPath
+# OpenCV is optional: its SIMD resize is used when installed, PIL's otherwise
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+# orjson is optional: it serializes responses when installed, flask.jsonify otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# libjpeg-turbo (PyTurboJPEG) is optional: it decodes JPEGs straight to RGB arrays
+# when installed along with the libturbojpeg library, Pillow is used otherwise
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    turbo_jpeg = TurboJPEG()
+except Exception:
+    turbo_jpeg = None
+
+# TensorRT is optional: without it (or without a GPU) the PyTorch models are used.
+# Building engines also needs the onnx package for the ONNX export.
+try:
+    import tensorrt as trt
+    import pycuda.driver as cuda
+    import pycuda.autoprimaryctx  # noqa: F401  (shares torch's primary CUDA context)
+except Exception:
+    trt = None
+    cuda = None
+
+# Inference only: no autograd bookkeeping on the main thread. Grad mode is
+# thread-local, so loaded models also have requires_grad disabled on their weights.
+torch.set_grad_enabled(False)
+
+# Use FBGEMM int8 kernels for quantized CPU inference where the platform supports them
+if 'fbgemm' in torch.backends.quantized.supported_engines:
+    torch.backends.quantized.engine = 'fbgemm'
 
 # Configure logging
 logging.basicConfig(level=logging.INFO,
@@ -29,18 +72,63 @@ def add_cors_headers(response):
     response.headers.add("Access-Control-Allow-Credentials", "true")
     return response
 
-# Configure upload folder
-UPLOAD_FOLDER = 'uploads'
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-
-# Allowed file extensions
+# Allowed file extensions (for calibration images read from disk)
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
-# Global variables to store the models
+# Magic bytes of the accepted upload formats; uploads are checked by content, not name
+_ALLOWED_MAGIC = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+)
+
+# Global variables to store the models (InferenceWrapper instances once loaded)
 yolov5_model = None
 yolov7_model = None  # Leave this if you plan to use it later
 
+# TensorRT settings: engines are cached next to the .pt checkpoints.
+# Set CALIB_DIR to a folder of plant images to build INT8 engines instead of FP16;
+# the same images calibrate the INT8 model used on CPU-only deployments, which
+# otherwise run in FP32.
+USE_TENSORRT = os.environ.get('USE_TENSORRT', '1') == '1'
+CALIB_DIR = os.environ.get('CALIB_DIR')
+# Half precision is only used for PyTorch models on GPU (it is slower on CPU);
+# set USE_HALF=0 to keep them in FP32
+USE_HALF = os.environ.get('USE_HALF', '1') == '1'
+# GPU PyTorch models replay CUDA graphs captured at startup instead of launching
+# every kernel per request; set USE_CUDA_GRAPHS=0 to disable
+USE_CUDA_GRAPHS = os.environ.get('USE_CUDA_GRAPHS', '1') == '1'
+# GPU PyTorch models are compiled with torch.compile (falling back to frozen TorchScript
+# if it fails); set USE_TORCH_COMPILE=0 to always use TorchScript
+USE_TORCH_COMPILE = os.environ.get('USE_TORCH_COMPILE', '1') == '1'
+INPUT_SHAPE = (1, 3, 640, 640)
+# Candidates with objectness at or below this are ignored, as in YOLOv5's NMS.
+# Cached engines and graphs are keyed on it, so changing it rebuilds them.
+CONF_THRESHOLD = float(os.environ.get('CONF_THRESHOLD', '0.25'))
+
+# Micro-batching: concurrent requests arriving within BATCH_TIMEOUT_MS of each other
+# are run together, up to BATCH_MAX images per forward
+BATCH_MAX = int(os.environ.get('BATCH_MAX', '16'))
+BATCH_TIMEOUT_MS = float(os.environ.get('BATCH_TIMEOUT_MS', '5'))
+
+# Per-thread model input buffers, reused across requests instead of reallocated
+_input_buffers = threading.local()
+
+# Recent /stream results keyed by client and perceptual hash: a client's near-identical
+# consecutive frames (fewer than STREAM_HASH_THRESHOLD differing bits) reuse its cached
+# result. The hash is too coarse to see symptoms, so entries expire after
+# STREAM_CACHE_TTL seconds and a camera held on a plant is re-analyzed that often.
+STREAM_CACHE_SIZE = 32
+STREAM_HASH_THRESHOLD = 4
+STREAM_CACHE_TTL = 1.0
+_stream_cache = OrderedDict()
+_stream_cache_lock = threading.Lock()
+
+# Batched forward timings for /health as (batch sequence number, seconds) pairs, one per
+# run_inference_batch call (which may serve several requests); next() on a
+# count and deque.append are atomic, so the hot path needs no lock or log formatting
+_inference_seq = itertools.count()
+_inference_times = deque(maxlen=1000)
+
 # Disease labels (adjust these indices to match your training)
 label_map = {
     0: "Early Blight",
@@ -55,90 +143,589 @@ label_map = {
 }
 
 
+# Treatment recommendations per disease, built once at import time as tuples so
+# responses can share them without risk of mutation
+_RECOMMENDATIONS = {
+    "Early Blight": (
+        "Remove infected leaves immediately",
+        "Apply copper-based fungicides",
+        "Maintain proper plant spacing for airflow",
+        "Avoid overhead watering to prevent spore spread",
+    ),
+    "Late Blight": (
+        "Remove and destroy all infected plant material",
+        "Apply fungicides preventively in humid conditions",
+        "Ensure good air circulation around plants",
+        "Use resistant varieties in future plantings",
+    ),
+    "Leaf Miner": (
+        "Remove and destroy affected leaves",
+        "Use yellow sticky traps to monitor and catch adults",
+        "Apply neem oil or insecticidal soap",
+        "Introduce natural predators like parasitic wasps",
+    ),
+    "Leaf Mold": (
+        "Improve air circulation around plants",
+        "Reduce humidity in growing environment",
+        "Apply fungicides at first sign of infection",
+        "Avoid overhead watering to keep foliage dry",
+    ),
+    "Mosaic Virus": (
+        "Remove and destroy infected plants completely",
+        "Control aphids and other insects that spread the virus",
+        "Wash hands and tools after handling infected plants",
+        "Plant resistant varieties in future",
+    ),
+    "Septoria": (
+        "Remove infected leaves to prevent spread",
+        "Apply fungicide at first sign of infection",
+        "Maintain proper plant spacing",
+        "Avoid overhead watering to keep foliage dry",
+    ),
+    "Spider Mites": (
+        "Spray plants with strong stream of water to dislodge mites",
+        "Apply insecticidal soap or neem oil to affected areas",
+        "Increase humidity around plants",
+        "Introduce predatory mites as biological control",
+    ),
+    "Yellow Leaf Curl Virus": (
+        "Remove and destroy all infected plants",
+        "Control whitefly populations with sticky traps",
+        "Use reflective mulches to repel whiteflies",
+        "Plant resistant varieties in future",
+    ),
+    "Healthy": (
+        "Continue regular maintenance",
+        "Monitor plants regularly for early signs of disease",
+        "Maintain proper watering and fertilization schedule",
+        "Ensure good air circulation around plants",
+    ),
+}
+
+_DEFAULT_RECOMMENDATION = (
+    "Consult with a plant pathologist for specific recommendations",
+    "Monitor the plant closely for changes in symptoms",
+    "Ensure proper growing conditions (light, water, nutrients)",
+)
+
+
+# With orjson (3.9+), recommendations are serialized once here and embedded in every
+# response as pre-encoded JSON fragments
+if hasattr(orjson, 'Fragment'):
+    _RECOMMENDATIONS = {name: orjson.Fragment(orjson.dumps(recs)) for name, recs in _RECOMMENDATIONS.items()}
+    _DEFAULT_RECOMMENDATION = orjson.Fragment(orjson.dumps(_DEFAULT_RECOMMENDATION))
+
+
 def get_recommendations(disease_name):
-    recommendations = {
-        "Early Blight": [
-            "Remove infected leaves immediately",
-            "Apply copper-based fungicides",
-            "Maintain proper plant spacing for airflow",
-            "Avoid overhead watering to prevent spore spread",
-        ],
-        "Late Blight": [
-            "Remove and destroy all infected plant material",
-            "Apply fungicides preventively in humid conditions",
-            "Ensure good air circulation around plants",
-            "Use resistant varieties in future plantings",
-        ],
-        "Leaf Miner": [
-            "Remove and destroy affected leaves",
-            "Use yellow sticky traps to monitor and catch adults",
-            "Apply neem oil or insecticidal soap",
-            "Introduce natural predators like parasitic wasps",
-        ],
-        "Leaf Mold": [
-            "Improve air circulation around plants",
-            "Reduce humidity in growing environment",
-            "Apply fungicides at first sign of infection",
-            "Avoid overhead watering to keep foliage dry",
-        ],
-        "Mosaic Virus": [
-            "Remove and destroy infected plants completely",
-            "Control aphids and other insects that spread the virus",
-            "Wash hands and tools after handling infected plants",
-            "Plant resistant varieties in future",
-        ],
-        "Septoria": [
-            "Remove infected leaves to prevent spread",
-            "Apply fungicide at first sign of infection",
-            "Maintain proper plant spacing",
-            "Avoid overhead watering to keep foliage dry",
-        ],
-        "Spider Mites": [
-            "Spray plants with strong stream of water to dislodge mites",
-            "Apply insecticidal soap or neem oil to affected areas",
-            "Increase humidity around plants",
-            "Introduce predatory mites as biological control",
-        ],
-        "Yellow Leaf Curl Virus": [
-            "Remove and destroy all infected plants",
-            "Control whitefly populations with sticky traps",
-            "Use reflective mulches to repel whiteflies",
-            "Plant resistant varieties in future",
-        ],
-        "Healthy": [
-            "Continue regular maintenance",
-            "Monitor plants regularly for early signs of disease",
-            "Maintain proper watering and fertilization schedule",
-            "Ensure good air circulation around plants",
-        ],
-    }
-    return recommendations.get(disease_name, [
-        "Consult with a plant pathologist for specific recommendations",
-        "Monitor the plant closely for changes in symptoms",
-        "Ensure proper growing conditions (light, water, nutrients)",
-    ])
+    return _RECOMMENDATIONS.get(disease_name, _DEFAULT_RECOMMENDATION)
+
+
+def jsonr(data, status=200):
+    """Return data as a JSON response, serialized with orjson when it is installed."""
+    if orjson is None:
+        return jsonify(data), status
+    return app.response_class(orjson.dumps(data), status=status, mimetype='application/json')
 
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def sniff_image_type(head):
+    """Return the image type for the leading bytes of a file, or None if not allowed."""
+    for magic, image_type in _ALLOWED_MAGIC:
+        if head.startswith(magic):
+            return image_type
+    return None
+
+
+def calibration_images():
+    """List the calibration images in CALIB_DIR (empty if it is not configured)."""
+    if not CALIB_DIR or not os.path.isdir(CALIB_DIR):
+        return []
+    return [os.path.join(CALIB_DIR, name) for name in sorted(os.listdir(CALIB_DIR)) if allowed_file(name)]
+
+
+class TRTRunner:
+    """
+    Run a serialized TensorRT engine with pre-allocated pinned host buffers and
+    device buffers sized for max_batch. Called like the PyTorch model it replaces.
+    """
+
+    def __init__(self, engine_path, max_batch=1):
+        runtime = trt.Runtime(trt.Logger(trt.Logger.WARNING))
+        with open(engine_path, 'rb') as f:
+            self.engine = runtime.deserialize_cuda_engine(f.read())
+        if self.engine is None:
+            raise RuntimeError(f"Could not deserialize TensorRT engine {engine_path}; delete it to rebuild")
+        self.context = self.engine.create_execution_context()
+        # pycuda contexts are per-thread: calls come from the batcher and forward pool
+        # threads, so the context current at load time is pushed around each call
+        self.cuda_context = cuda.Context.get_current()
+        self.stream = cuda.Stream()
+        self.max_batch = max_batch
+        for i in range(self.engine.num_io_tensors):
+            name = self.engine.get_tensor_name(i)
+            # The batch dimension is dynamic (-1); size buffers for the largest batch
+            shape = (max_batch, *self.engine.get_tensor_shape(name)[1:])
+            dtype = trt.nptype(self.engine.get_tensor_dtype(name))
+            host_buf = cuda.pagelocked_empty(trt.volume(shape), dtype)
+            device_buf = cuda.mem_alloc(host_buf.nbytes)
+            self.context.set_tensor_address(name, int(device_buf))
+            if self.engine.get_tensor_mode(name) == trt.TensorIOMode.INPUT:
+                self.input = (name, host_buf, device_buf)
+            else:
+                # The engine includes BestDetectionHead, so its only output is [N, 2]
+                self.output = (name, host_buf, device_buf)
+
+    def __call__(self, img_tensor):
+        self.cuda_context.push()
+        try:
+            return self._run(img_tensor)
+        finally:
+            cuda.Context.pop()
+
+    def _run(self, img_tensor):
+        input_name, host_in, device_in = self.input
+        output_name, host_out, device_out = self.output
+        self.context.set_input_shape(input_name, tuple(img_tensor.shape))
+        host_in = host_in[:img_tensor.numel()]
+        np.copyto(host_in, img_tensor.cpu().numpy().ravel())
+        cuda.memcpy_htod_async(device_in, host_in, self.stream)
+        self.context.execute_async_v3(self.stream.handle)
+        out_shape = tuple(self.context.get_tensor_shape(output_name))
+        host_out = host_out[:trt.volume(out_shape)]
+        cuda.memcpy_dtoh_async(host_out, device_out, self.stream)
+        self.stream.synchronize()
+        # Copy out of the pinned buffer, which the next call overwrites
+        return torch.from_numpy(host_out.reshape(out_shape).copy())
+
+
+class CUDAGraphRunner:
+    """
+    Replay CUDA graphs of a GPU model captured once per batch size (powers of two up
+    to max_batch), so a request costs one graph launch instead of hundreds of kernel
+    launches. Batches are padded up to the nearest captured size. Called like the
+    model it wraps.
+    """
+
+    def __init__(self, model, device, dtype, max_batch, memory_format=torch.contiguous_format):
+        self.max_batch = max_batch
+        self.static_input = torch.zeros(max_batch, *INPUT_SHAPE[1:], device=device,
+                                        dtype=dtype).to(memory_format=memory_format)
+        self.sizes = sorted({1 << i for i in range(max_batch.bit_length()) if 1 << i < max_batch} | {max_batch})
+        self.graphs = {}
+        pool = None
+        # Capture the largest batch first; the smaller graphs share its memory pool
+        for size in reversed(self.sizes):
+            static_input = self.static_input[:size]
+            # Warm up outside capture so cuDNN autotuning and TorchScript's profiling
+            # runs for this shape happen before the graph is recorded
+            side_stream = torch.cuda.Stream()
+            side_stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(side_stream):
+                for _ in range(3):
+                    model(static_input)
+            torch.cuda.current_stream().wait_stream(side_stream)
+
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph, pool=pool):
+                static_output = model(static_input)
+            pool = graph.pool()
+            self.graphs[size] = (graph, static_output)
+
+    def __call__(self, img_tensor):
+        batch_size = img_tensor.shape[0]
+        graph, static_output = self.graphs[next(s for s in self.sizes if s >= batch_size)]
+        self.static_input[:batch_size].copy_(img_tensor)
+        graph.replay()
+        # The graphs share one memory pool, so copy out before the next replay overwrites it
+        return static_output[:batch_size].clone()
+
+
+def to_cuda_graph_runner(model, device, dtype, max_batch, memory_format):
+    """Wrap a GPU model in a CUDAGraphRunner, or return it unchanged if capture fails."""
+    if not USE_CUDA_GRAPHS:
+        return model
+    try:
+        return CUDAGraphRunner(model, device, dtype, max_batch, memory_format)
+    except Exception as e:
+        logger.warning(f"CUDA graph capture failed, running the model directly: {str(e)}")
+        return model
+
+
+@dataclass
+class InferenceWrapper:
+    """
+    A loaded model plus the state inference needs, resolved once at load time:
+    the device, dtype and memory format its input must have, the CUDA stream it runs
+    on and the largest batch it accepts.
+    """
+    model: object
+    device: torch.device = torch.device('cpu')
+    dtype: torch.dtype = torch.float32
+    stream: object = None
+    max_batch: int = 1
+    memory_format: torch.memory_format = torch.contiguous_format
+
+    def __call__(self, img_tensor):
+        return self.model(img_tensor)
+
+
+# Version of the graph built around the detector (DetectorWithHead/BestDetectionHead).
+# It and CONF_THRESHOLD, which the head bakes in, are part of every cached graph's
+# file name: bump it when either class changes.
+HEAD_VERSION = 3
+
+
+def cache_path(pt_path, suffix, *key):
+    """
+    Path for an artifact generated from a checkpoint, e.g. modelv5.1a2b3c4d_b16.trt.
+    The tag hashes the checkpoint's size and mtime plus any extra key values, so
+    retrained weights (or a new head version) get a fresh artifact instead of a stale one.
+    """
+    stat = os.stat(pt_path)
+    tag = hashlib.sha1(repr((stat.st_size, stat.st_mtime_ns, *key)).encode()).hexdigest()[:8]
+    return f"{os.path.splitext(pt_path)[0]}.{tag}{suffix}"
+
+
+class BestDetectionHead(torch.nn.Module):
+    """
+    Reduce raw YOLOv5 output to an [N, 2] tensor of (class, score) for the best candidate
+    of each image, so the selection runs inside the exported/frozen graph instead of as
+    eager Python ops. Expects predictions of shape [N, 25200, 14]:
+      - Columns 0-3: Bounding box coordinates
+      - Column 4: Objectness confidence
+      - Columns 5-13: Class scores (for 9 classes)
+    Candidates with objectness at or below conf_threshold are ignored; images with none
+    left get class -1 and score 0. The threshold is applied by masking rather than by
+    dropping rows, so shapes stay fixed and the head still traces, exports and
+    graph-captures.
+    """
+
+    def __init__(self, conf_threshold=CONF_THRESHOLD):
+        super().__init__()
+        self.conf_threshold = conf_threshold
+
+    def forward(self, predictions):
+        # Score in FP32 even for FP16 models, transposed to a contiguous [N, 14, 25200] so
+        # each column below is read as one contiguous row rather than every 14th value
+        # (.to() alone would return a strided view for FP32 input)
+        predictions = predictions.to(torch.float32).transpose(1, 2).contiguous()
+        objectness = predictions[:, 4]                                                # [N, 25200]
+        # Final score per candidate is objectness x best class score. Objectness is
+        # non-negative, so taking the class max first gives the same winner without
+        # materializing the full [N, 9, 25200] product.
+        class_max, class_indices = predictions[:, 5:].max(dim=1)                      # [N, 25200] each
+        scores = (objectness * class_max).masked_fill(objectness <= self.conf_threshold, 0.0)
+        best_score, best_index = scores.max(dim=1)                                    # [N] each
+        best_class = class_indices.gather(1, best_index.unsqueeze(1)).squeeze(1)
+        best_class = best_class.masked_fill(best_score <= 0, -1)
+        return torch.stack((best_class.float(), best_score), dim=1)
+
+
+class DetectorWithHead(torch.nn.Module):
+    """A YOLO detector followed by BestDetectionHead."""
+
+    def __init__(self, detector):
+        super().__init__()
+        self.detector = detector
+        self.head = BestDetectionHead()
+
+    def forward(self, img_tensor):
+        # Eval-mode YOLO returns (merged detections, per-level feature maps)
+        return self.head(self.detector(img_tensor)[0])
+
+
+def build_trt_engine(model, pt_path, max_batch):
+    """
+    Export a PyTorch model to ONNX with a dynamic batch dimension and build a TensorRT
+    engine for batches of 1 to max_batch next to the checkpoint (e.g. modelv5.1a2b3c4d_b16.trt).
+    Builds INT8 when CALIB_DIR holds calibration images, FP16 otherwise.
+    Returns the engine path, reusing a cached engine built from the same checkpoint in the
+    same precision, by the same TensorRT version and for the same GPU.
+    """
+    calib_images = calibration_images()
+    engine_path = cache_path(pt_path, f'_b{max_batch}.trt', HEAD_VERSION, CONF_THRESHOLD,
+                             bool(calib_images), trt.__version__, torch.cuda.get_device_name())
+    if os.path.exists(engine_path):
+        return engine_path
+
+    onnx_path = cache_path(pt_path, f'_b{max_batch}.onnx', HEAD_VERSION, CONF_THRESHOLD)
+    dummy = torch.zeros(*INPUT_SHAPE)
+    # TorchScript-based exporter: dynamic_axes is not supported by the dynamo exporter
+    torch.onnx.export(model.float().cpu(), dummy, onnx_path, opset_version=17,
+                      input_names=['images'], output_names=['best'],
+                      dynamic_axes={'images': {0: 'batch'}, 'best': {0: 'batch'}}, dynamo=False)
+
+    trt_logger = trt.Logger(trt.Logger.WARNING)
+    builder = trt.Builder(trt_logger)
+    network = builder.create_network(1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH))
+    parser = trt.OnnxParser(network, trt_logger)
+    with open(onnx_path, 'rb') as f:
+        if not parser.parse(f.read()):
+            errors = [str(parser.get_error(i)) for i in range(parser.num_errors)]
+            raise RuntimeError(f"Failed to parse ONNX model: {errors}")
+
+    config = builder.create_builder_config()
+    profile = builder.create_optimization_profile()
+    profile.set_shape('images', INPUT_SHAPE, (max(1, max_batch // 2), *INPUT_SHAPE[1:]),
+                      (max_batch, *INPUT_SHAPE[1:]))
+    config.add_optimization_profile(profile)
+    if calib_images and builder.platform_has_fast_int8:
+        class PlantImageCalibrator(trt.IInt8EntropyCalibrator2):
+            """Feed calibration images one at a time through the preprocessing pipeline."""
+
+            def __init__(self, image_paths, cache_path):
+                super().__init__()
+                self.image_paths = list(image_paths)
+                self.cache_path = cache_path
+                self.device_buf = cuda.mem_alloc(int(np.prod(INPUT_SHAPE)) * 4)
+
+            def get_batch_size(self):
+                return 1
+
+            def get_batch(self, names):
+                if not self.image_paths:
+                    return None
+                img = to_model_input([preprocess_image(image_path=self.image_paths.pop(0))])
+                cuda.memcpy_htod(self.device_buf, np.ascontiguousarray(img.numpy(), dtype=np.float32))
+                return [int(self.device_buf)]
+
+            def read_calibration_cache(self):
+                if os.path.exists(self.cache_path):
+                    with open(self.cache_path, 'rb') as f:
+                        return f.read()
+                return None
+
+            def write_calibration_cache(self, cache):
+                with open(self.cache_path, 'wb') as f:
+                    f.write(cache)
+
+        config.set_flag(trt.BuilderFlag.INT8)
+        # TensorRT calibrates at the calibration profile's opt shape, and the calibrator
+        # feeds one image at a time, so calibration gets its own fixed batch-of-one profile
+        calib_profile = builder.create_optimization_profile()
+        calib_profile.set_shape('images', INPUT_SHAPE, INPUT_SHAPE, INPUT_SHAPE)
+        config.set_calibration_profile(calib_profile)
+        calib_cache = cache_path(pt_path, '.calib', HEAD_VERSION, CONF_THRESHOLD)
+        config.int8_calibrator = PlantImageCalibrator(calib_images, calib_cache)
+        logger.info(f"Building INT8 TensorRT engine with {len(calib_images)} calibration images...")
+    else:
+        config.set_flag(trt.BuilderFlag.FP16)
+        logger.info("Building FP16 TensorRT engine...")
+
+    serialized = builder.build_serialized_network(network, config)
+    if serialized is None:
+        raise RuntimeError("TensorRT engine build failed")
+    with open(engine_path, 'wb') as f:
+        f.write(serialized)
+    return engine_path
+
+
+def to_trt_runner(model, pt_path):
+    """Swap a PyTorch model for a TensorRT runner when TensorRT and a GPU are available."""
+    if not (USE_TENSORRT and trt is not None and torch.cuda.is_available()):
+        return model
+    try:
+        runner = TRTRunner(build_trt_engine(model, pt_path, BATCH_MAX), BATCH_MAX)
+        logger.info(f"TensorRT engine ready for {pt_path}")
+        return runner
+    except Exception as e:
+        logger.warning(f"TensorRT unavailable for {pt_path}, using PyTorch: {str(e)}")
+        return model
+
+
+def quantize_cpu_model(model, pt_path):
+    """
+    Statically quantize a model to INT8 for CPU inference with FX, calibrated on CALIB_DIR
+    images, and cache it as TorchScript next to the checkpoint (e.g. modelv5.1a2b3c4d_int8.pt),
+    reloading it on later boots. YOLO's Detect layer and BestDetectionHead stay in FP32.
+    Returns None when there are no calibration images or nothing could be quantized.
+    """
+    int8_path = cache_path(pt_path, '_int8.pt', HEAD_VERSION, CONF_THRESHOLD)
+    if os.path.exists(int8_path):
+        logger.info(f"Loading cached INT8 model from {int8_path}")
+        return torch.jit.load(int8_path, map_location='cpu').eval()
+
+    calib_images = calibration_images()
+    if not calib_images:
+        logger.warning("No calibration images in CALIB_DIR, so the CPU model is not quantized and runs in FP32")
+        return None
+
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.fx.custom_config import PrepareCustomConfig
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    # Detect caches its anchor grid behind a tensor-shape check FX cannot trace, so it is
+    # kept as an opaque FP32 module (matched by name: it lives in the YOLOv5 sources)
+    detect_classes = list({type(m) for m in model.modules() if type(m).__name__ == 'Detect'})
+    qconfig_mapping = get_default_qconfig_mapping(torch.backends.quantized.engine)
+    for module_class in detect_classes + [BestDetectionHead]:
+        qconfig_mapping.set_object_type(module_class, None)
+
+    dummy = torch.zeros(*INPUT_SHAPE)
+    try:
+        custom_config = PrepareCustomConfig().set_non_traceable_module_classes(detect_classes)
+        prepared = prepare_fx(model, qconfig_mapping, example_inputs=(dummy,),
+                              prepare_custom_config=custom_config)
+        with torch.no_grad():
+            for path in calib_images[:32]:
+                prepared(to_model_input([preprocess_image(image_path=path)]))
+        quantized = convert_fx(prepared)
+    except Exception as e:
+        logger.warning(f"INT8 quantization failed, so the CPU model runs in FP32: {str(e)}")
+        return None
+    if not any(isinstance(m, torch.ao.nn.quantized.Conv2d) for m in quantized.modules()):
+        logger.warning("INT8 quantization left every convolution in FP32, so the CPU model runs in FP32")
+        return None
+    logger.info(f"Statically quantized model with {min(len(calib_images), 32)} calibration images")
+
+    with torch.no_grad():
+        scripted = torch.jit.trace(quantized.eval(), dummy, strict=False)
+    scripted = torch.jit.freeze(scripted)
+    torch.jit.save(scripted, int8_path)
+    return scripted
+
+
+def freeze_model(model, pt_path, device, dtype=torch.float32, memory_format=torch.contiguous_format):
+    """
+    Script (or trace, if scripting fails) and freeze a model for inference, caching
+    the frozen TorchScript next to the checkpoint (e.g. modelv5.1a2b3c4d_cuda_fp16_nhwc.torchscript).
+    """
+    precision = 'fp16' if dtype == torch.float16 else 'fp32'
+    layout = '_nhwc' if memory_format == torch.channels_last else ''
+    ts_path = cache_path(pt_path, f'_{device.type}_{precision}{layout}.torchscript', HEAD_VERSION, CONF_THRESHOLD)
+    if os.path.exists(ts_path):
+        logger.info(f"Loading cached TorchScript model from {ts_path}")
+        return torch.jit.optimize_for_inference(torch.jit.load(ts_path, map_location=device).eval())
+
+    model = model.to(device=device, dtype=dtype, memory_format=memory_format).eval()
+    try:
+        scripted = torch.jit.script(model)
+    except Exception as e:
+        logger.info(f"torch.jit.script failed, tracing instead: {str(e)}")
+        with torch.no_grad():
+            dummy = torch.zeros(*INPUT_SHAPE, device=device, dtype=dtype).to(memory_format=memory_format)
+            scripted = torch.jit.trace(model, dummy, strict=False)
+    scripted = torch.jit.freeze(scripted.eval())
+    # Saved before optimize_for_inference: the ops it inserts (e.g. prepacked MKLDNN
+    # convolutions on CPU) cannot be reloaded, so it is applied after every load instead
+    torch.jit.save(scripted, ts_path)
+    return torch.jit.optimize_for_inference(scripted)
+
+
+def compile_model(model, device, dtype=torch.float32, memory_format=torch.contiguous_format):
+    """
+    Compile a model with torch.compile so Inductor fuses its elementwise chains, and run
+    it once so the first request does not pay the compile. CUDA graphs are left to
+    CUDAGraphRunner, which pads batches to a few fixed sizes. Returns None on failure.
+    """
+    model = model.to(device=device, dtype=dtype, memory_format=memory_format).eval()
+    try:
+        compiled = torch.compile(model)
+        compiled(torch.zeros(*INPUT_SHAPE, device=device, dtype=dtype).to(memory_format=memory_format))
+        return compiled
+    except Exception as e:
+        logger.warning(f"torch.compile failed, freezing with TorchScript instead: {str(e)}")
+        return None
+
+
+def optimize_model(model, pt_path, device):
+    """
+    Pick the fastest available backend for a freshly loaded model: TensorRT on GPU
+    when available, otherwise torch.compile or frozen TorchScript in FP16 on GPU, and
+    INT8-quantized TorchScript on CPU (frozen FP32 without calibration images). GPU
+    PyTorch models are further captured into CUDA graphs. Every backend includes
+    BestDetectionHead, so models return [N, 2] (class, score) rows.
+    Returns an InferenceWrapper, warmed up so the first request does not pay JIT costs.
+    """
+    model = DetectorWithHead(model).eval()
+    if device.type == 'cuda':
+        optimized = to_trt_runner(model, pt_path)
+        if isinstance(optimized, TRTRunner):
+            # TensorRT copies FP32 input from host memory on its own stream
+            return InferenceWrapper(optimized, max_batch=optimized.max_batch)
+        # Channels-last (NHWC) lets cuDNN use its tensor-core FP16 convolution kernels
+        dtype = torch.float16 if USE_HALF else torch.float32
+        gpu_model = compile_model(model, device, dtype, torch.channels_last) if USE_TORCH_COMPILE else None
+        if gpu_model is None:
+            gpu_model = freeze_model(model, pt_path, device, dtype, torch.channels_last)
+        wrapper = InferenceWrapper(
+            to_cuda_graph_runner(gpu_model, device, dtype, batcher.max_batch, torch.channels_last),
+            device, dtype, torch.cuda.Stream(), batcher.max_batch, torch.channels_last)
+    else:
+        cpu_model = quantize_cpu_model(model, pt_path)
+        if cpu_model is None:
+            cpu_model = freeze_model(model, pt_path, device)
+        wrapper = InferenceWrapper(cpu_model, max_batch=batcher.max_batch)
+
+    with torch.no_grad():
+        wrapper(to_model_input([torch.zeros(*INPUT_SHAPE[2:], 3, dtype=torch.uint8)],
+                               wrapper.device, wrapper.dtype, wrapper.memory_format))
+    return wrapper
+
+
+@contextmanager
+def posix_paths_on_windows():
+    """Let checkpoints pickled on Linux, which reference PosixPath, unpickle on Windows."""
+    if os.name != 'nt':
+        yield
+        return
+    posix_path = pathlib.PosixPath
+    pathlib.PosixPath = pathlib.WindowsPath
+    try:
+        yield
+    finally:
+        pathlib.PosixPath = posix_path
+
+
+def load_checkpoint(path):
+    """
+    Load a YOLOv5 checkpoint as an FP32 eval model with frozen weights.
+    The first load of each checkpoint version unpickles it in full and re-saves its
+    architecture config and state_dict next to it (e.g. modelv5.1a2b3c4d_weights.pt, tagged
+    like every cached artifact). Every load then reads that file with weights_only=True,
+    which runs no pickled code, and rebuilds the model from the YOLOv5 sources. Weights
+    are memory-mapped and assigned to the model without a copy, so restarts are served
+    from the page cache.
+    """
+    from models.yolo import Model
+
+    weights_path = cache_path(path, '_weights.pt')
+    if not os.path.exists(weights_path):
+        logger.info(f"Converting {path} to a weights-only checkpoint at {weights_path}")
+        with posix_paths_on_windows():
+            ckpt = torch.load(path, map_location='cpu', weights_only=False)
+        model = (ckpt.get('ema') or ckpt['model']).float()
+        torch.save({'yaml': model.yaml, 'state_dict': model.state_dict()}, weights_path)
+
+    weights = torch.load(weights_path, map_location='cpu', mmap=True, weights_only=True)
+    model = Model(weights['yaml'])
+    model.load_state_dict(weights['state_dict'], assign=True)
+    if hasattr(model, 'fuse'):
+        model = model.fuse()
+    return model.eval().requires_grad_(False)
+
+
 def load_models():
     """Load YOLOv5 (and optionally YOLOv7) models."""
     global yolov5_model, yolov7_model
 
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     logger.info(f"Using device: {device}")
+    if device.type == 'cpu':
+        # Request threads only queue work for the batcher thread, the one thread that
+        # runs forwards, so every core goes to its intra-op pool without oversubscription
+        torch.set_num_threads(os.cpu_count() or 1)
 
-    # Load YOLOv5 using YOLOv5's attempt_load
+    # Load YOLOv5 (the YOLOv5 sources must be on the path to build the model)
     try:
         sys.path.insert(0, os.path.join(os.getcwd(), 'yolov5'))
-        from yolov5.models.experimental import attempt_load
         logger.info("Loading YOLOv5 model...")
         yolov5_path = os.path.join('model', 'yolov', 'modelv5.pt')
         if os.path.exists(yolov5_path):
-            yolov5_model = attempt_load(yolov5_path)
-            yolov5_model.eval()
+            yolov5_model = optimize_model(load_checkpoint(yolov5_path), yolov5_path, device)
             logger.info("YOLOv5 model loaded successfully")
         else:
             logger.warning(f"YOLOv5 model file not found at {yolov5_path}")
@@ -165,93 +752,337 @@ def load_models():
         logger.error(f"Error loading YOLOv7 model: {str(e)}")
 
 
+def decode_jpeg(image_data):
+    """
+    Decode a JPEG to an RGB uint8 array with libjpeg-turbo, at the smallest DCT scale
+    (1/8, 1/4 or 1/2) that still covers 640x640, like Pillow's draft mode.
+    """
+    width, height = turbo_jpeg.decode_header(image_data)[:2]
+    scale = next(((1, d) for d in (8, 4, 2) if width // d >= 640 and height // d >= 640), (1, 1))
+    return turbo_jpeg.decode(image_data, pixel_format=TJPF_RGB, scaling_factor=scale)
+
+
 def preprocess_image(image_path=None, image_data=None):
-    """Preprocess image for inference (resize and convert to tensor)."""
+    """Preprocess image for inference (resize and convert to a uint8 HWC tensor)."""
     try:
         if image_path:
-            img = Image.open(image_path)
-        elif image_data:
-            img = Image.open(io.BytesIO(image_data))
-        else:
+            with open(image_path, 'rb') as f:
+                image_data = f.read()
+        elif not image_data:
             raise ValueError("Either image_path or image_data must be provided")
 
-        # Resize to 640x640 (YOLOv5 default)
-        img = img.resize((640, 640))
-        # Convert image to numpy array
-        img_array = np.array(img)
-        # If image is not 3-channel, convert to RGB
-        if img_array.ndim == 2 or img_array.shape[2] != 3:
-            img = img.convert("RGB")
-            img_array = np.array(img)
-        # Convert to tensor (note: YOLOv5 models usually expect a numpy array)
-        img_tensor = torch.from_numpy(img_array).float()
-        # Rearrange dimensions to [batch_size, channels, height, width]
-        if len(img_tensor.shape) == 3:
-            img_tensor = img_tensor.permute(2, 0, 1)
-        img_tensor = img_tensor.unsqueeze(0)  # Add batch dimension
-        return img_tensor
+        img = None
+        if turbo_jpeg is not None and sniff_image_type(image_data[:8]) == 'jpg':
+            try:
+                img_array = decode_jpeg(image_data)
+            except Exception:
+                # e.g. CMYK JPEGs, which libjpeg-turbo cannot convert to RGB
+                img = Image.open(io.BytesIO(image_data))
+        else:
+            img = Image.open(io.BytesIO(image_data))
+
+        if img is not None:
+            # Let libjpeg decode large JPEGs at a reduced scale (no-op for other formats)
+            img.draft('RGB', (640, 640))
+            # Normalize grayscale/RGBA/palette uploads to RGB (convert copies even RGB images)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            img_array = np.asarray(img)
+        # Resize to 640x640 (YOLOv5 default) while still uint8
+        if cv2 is not None:
+            img_array = cv2.resize(img_array, (640, 640), interpolation=cv2.INTER_LINEAR)
+        else:
+            img_array = np.array(Image.fromarray(img_array).resize((640, 640), Image.Resampling.BILINEAR))
+        # Keep the tensor as uint8 HWC; to_model_input converts it to float on the target device
+        return torch.from_numpy(img_array)
     except Exception as e:
         logger.error(f"Image preprocessing error: {str(e)}")
         raise
 
 
-def run_inference(model, img_tensor):
+def thread_buffer(batch_size, shape, device='cpu', dtype=torch.float32,
+                  memory_format=torch.contiguous_format, pin_memory=False):
     """
-    Run inference using the YOLOv5 detection model.
-    Assumes model output shape is [1, 25200, 14]:
-      - Columns 0-3: Bounding box coordinates
-      - Column 4: Objectness confidence
-      - Columns 5-13: Class scores (for 9 classes)
+    Return a persistent [N, *shape] buffer owned by the calling thread. One buffer per
+    shape/device/dtype/layout is kept at the largest batch seen and sliced for smaller ones.
     """
-    if not model:
-        raise ValueError("Model not loaded")
+    buffers = getattr(_input_buffers, 'buffers', None)
+    if buffers is None:
+        buffers = _input_buffers.buffers = {}
+    key = (tuple(shape), torch.device(device), dtype, memory_format, pin_memory)
+    if key not in buffers or buffers[key].shape[0] < batch_size:
+        buffers[key] = torch.empty(batch_size, *shape, device=key[1], dtype=dtype,
+                                   memory_format=memory_format, pin_memory=pin_memory)
+    return buffers[key][:batch_size]
 
-    device = next(model.parameters()).device
-    img_tensor = img_tensor.to(device)
 
-    try:
-        with torch.no_grad():
-            predictions = model(img_tensor)[0]  # shape: [1, 25200, 14]
+def input_buffer(device, dtype, batch_size=1, memory_format=torch.contiguous_format):
+    """Return this thread's persistent [N, 3, 640, 640] input buffer for device/dtype/layout."""
+    return thread_buffer(batch_size, INPUT_SHAPE[1:], device, dtype, memory_format)
 
-        # Check if any predictions were made
-        if predictions.shape[1] == 0:
-            raise ValueError("No detections were made.")
 
-        # Remove the batch dimension: shape becomes [25200, 14]
-        predictions = predictions[0]
+def perceptual_hash(img_tensor):
+    """
+    64-bit average hash of a 640x640 uint8 HWC image: sample a 64x64 grid, average it
+    down to 8x8 grayscale and set one bit per cell brighter than the mean.
+    """
+    grid = img_tensor.numpy()[5::10, 5::10].astype(np.float32)
+    cells = grid.reshape(8, 8, 8, 8, 3).mean(axis=(1, 3, 4))
+    bits = np.packbits((cells > cells.mean()).flatten())
+    return int.from_bytes(bits.tobytes(), 'big')
 
-        # Extract objectness scores and class scores
-        obj_conf = predictions[:, 4]            # Shape: [25200]
-        class_scores = predictions[:, 5:]         # Shape: [25200, 9]
 
-        # Compute final scores by multiplying objectness with class scores
-        # This gives a score for each candidate for each class
-        final_scores = obj_conf.unsqueeze(1) * class_scores  # Shape: [25200, 9]
+def lookup_stream_cache(client, image_hash):
+    """Return the client's unexpired results for a frame close to a recent one, else None."""
+    now = time.monotonic()
+    with _stream_cache_lock:
+        for (cached_client, cached_hash), (expires, results) in _stream_cache.items():
+            if (cached_client == client and expires > now
+                    and bin(image_hash ^ cached_hash).count('1') < STREAM_HASH_THRESHOLD):
+                return results
+    return None
 
-        # For each candidate, find the best class and its score
-        max_scores, class_indices = torch.max(final_scores, dim=1)  # Each is [25200]
 
-        # Get the candidate with the highest final score across all predictions
-        best_score, best_index = torch.max(max_scores, dim=0)
-        best_class = int(class_indices[best_index].item())
-        confidence = float(best_score.item())
+def store_stream_cache(client, image_hash, results):
+    """Remember the results for a client's frame, evicting expired and then oldest entries."""
+    now = time.monotonic()
+    with _stream_cache_lock:
+        # Entries are kept in insertion order, which with a fixed TTL is expiry order
+        _stream_cache.pop((client, image_hash), None)
+        _stream_cache[(client, image_hash)] = (now + STREAM_CACHE_TTL, results)
+        while _stream_cache:
+            expires, _ = next(iter(_stream_cache.values()))
+            if expires > now and len(_stream_cache) <= STREAM_CACHE_SIZE:
+                break
+            _stream_cache.popitem(last=False)
 
-        # Lookup disease name based on class index
-        disease_name = label_map.get(best_class, "Unknown")
-        logger.info(f"Detection: {disease_name} with confidence {confidence:.2f}")
 
-        return {
-            "disease": disease_name,
-            "confidence": confidence,
-            "recommendations": get_recommendations(disease_name)
-        }
-    except Exception as e:
-        logger.error(f"Inference error: {str(e)}")
-        raise ValueError(f"Error during inference: {str(e)}")
+def to_model_input(img_tensors, device='cpu', dtype=torch.float32, memory_format=torch.contiguous_format):
+    """
+    Turn a list of uint8 HWC image tensors into a normalized float [N, 3, H, W] batch
+    on device. The result is written into the calling thread's persistent input buffer,
+    so it is only valid until that thread prepares its next input. With channels_last
+    the buffer already has HWC strides, so the copy needs no transpose.
+    """
+    device = torch.device(device)
+    batch = input_buffer(device, dtype, len(img_tensors), memory_format)
+    if device.type != 'cuda':
+        for i, img_tensor in enumerate(img_tensors):
+            torch.mul(img_tensor.permute(2, 0, 1), 1 / 255.0, out=batch[i])
+        return batch
+
+    # Stage the uint8 images in this thread's pinned host buffer and send them to the
+    # device in one asynchronous copy; the previous copy out of the staging buffer
+    # must have finished before it is overwritten
+    image_shape = (*INPUT_SHAPE[2:], 3)
+    staging_done = getattr(_input_buffers, 'staging_done', None)
+    if staging_done is not None:
+        staging_done.synchronize()
+    host = thread_buffer(len(img_tensors), image_shape, dtype=torch.uint8, pin_memory=True)
+    for i, img_tensor in enumerate(img_tensors):
+        host[i].copy_(img_tensor)
+    staged = thread_buffer(len(img_tensors), image_shape, device, torch.uint8)
+    staged.copy_(host, non_blocking=True)
+    _input_buffers.staging_done = torch.cuda.Event()
+    _input_buffers.staging_done.record()
+
+    # Only uint8 bytes cross to the device; the NHWC->NCHW view, float cast and /255
+    # then happen in a single kernel writing straight into the buffer
+    return torch.mul(staged.permute(0, 3, 1, 2), 1 / 255.0, out=batch)
+
+
+def describe_detection(best):
+    """Turn one [class, score] row of a model's output into the API result for it."""
+    # One device-to-host sync for both values
+    best_class, confidence = best.tolist()
+    best_class = int(best_class)
+
+    # Lookup disease name based on class index (-1, nothing above CONF_THRESHOLD, is "Unknown")
+    disease_name = label_map.get(best_class, "Unknown")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Detection: {disease_name} with confidence {confidence:.2f}")
+
+    return {
+        "disease": disease_name,
+        "confidence": confidence,
+        "recommendations": get_recommendations(disease_name)
+    }
+
+
+def forward_batch(model, img_tensors):
+    """Launch a model's forward over a list of images, in chunks of its max_batch."""
+    outputs = []
+    for i in range(0, len(img_tensors), model.max_batch):
+        batch = to_model_input(img_tensors[i:i + model.max_batch], model.device, model.dtype,
+                               model.memory_format)
+        outputs.append(model(batch))
+    return torch.cat(outputs) if len(outputs) > 1 else outputs[0]
+
+
+def run_inference_batch(img_tensors):
+    """
+    Run YOLOv5 and YOLOv7 on a batch of images and return one (yolov5_result,
+    yolov7_result) tuple per image. Each model runs one batched forward, and on GPU
+    both forwards overlap: PyTorch models are issued on their own CUDA streams and
+    TensorRT engines, whose calls block until done, run on _forward_pool threads.
+    A missing or failed model yields an {"error": ...} dict in its slot.
+    """
+    models = (("YOLOv5", yolov5_model), ("YOLOv7", yolov7_model))
+
+    # Launch every forward before synchronizing on any of them
+    start = time.perf_counter()
+    outputs = {}
+    for name, model in models:
+        if not model:
+            continue
+        try:
+            if model.stream is not None:
+                model.stream.wait_stream(torch.cuda.current_stream())
+                with torch.cuda.stream(model.stream):
+                    outputs[name] = forward_batch(model, img_tensors)
+            elif isinstance(model.model, TRTRunner):
+                outputs[name] = _forward_pool.submit(forward_batch, model, img_tensors)
+            else:
+                outputs[name] = forward_batch(model, img_tensors)
+        except Exception as e:
+            outputs[name] = e
+    for name, output in outputs.items():
+        if isinstance(output, Future):
+            try:
+                outputs[name] = output.result()
+            except Exception as e:
+                outputs[name] = e
+    if any(model and model.stream is not None for _, model in models):
+        torch.cuda.synchronize()
+    _inference_times.append((next(_inference_seq), time.perf_counter() - start))
+
+    per_model = []
+    for name, model in models:
+        if not model:
+            per_model.append([{"error": f"{name} model not loaded"}] * len(img_tensors))
+            continue
+        try:
+            if isinstance(outputs[name], Exception):
+                raise outputs[name]
+            per_model.append([describe_detection(best) for best in outputs[name].cpu()])
+        except Exception as e:
+            logger.error(f"{name} inference error: {str(e)}")
+            per_model.append([{"error": f"{name} inference failed: {str(e)}"}] * len(img_tensors))
+    return list(zip(*per_model))
+
+
+class InferenceBatcher:
+    """
+    Coalesce concurrent requests into batched forwards on one background thread.
+    Each request queues its image and waits on an Event; the worker collects up to
+    max_batch images arriving within window seconds of the first, runs them through
+    run_inference_batch together and hands each request its own results.
+    """
+
+    def __init__(self, max_batch=16, window=0.005):
+        self.max_batch = max_batch
+        self.window = window
+        self.pending = queue.Queue()
+        self.worker = None
+        self.worker_lock = threading.Lock()
+
+    def submit(self, img_tensor):
+        """Queue one image and block until its (yolov5_result, yolov7_result) is ready."""
+        self._ensure_worker()
+        item = {"image": img_tensor, "done": threading.Event(), "result": None}
+        self.pending.put(item)
+        item["done"].wait()
+        if isinstance(item["result"], Exception):
+            raise item["result"]
+        return item["result"]
+
+    def _ensure_worker(self):
+        # Started lazily so the thread exists in the process that serves requests
+        with self.worker_lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name="inference-batcher", daemon=True)
+                self.worker.start()
+
+    def _run(self):
+        while True:
+            items = [self.pending.get()]
+            deadline = time.perf_counter() + self.window
+            while len(items) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                # inference_mode also skips the version-counter and view tracking no_grad keeps
+                with torch.inference_mode():
+                    results = run_inference_batch([item["image"] for item in items])
+                for item, result in zip(items, results):
+                    item["result"] = result
+            except Exception as e:
+                for item in items:
+                    item["result"] = e
+            for item in items:
+                item["done"].set()
+
+
+batcher = InferenceBatcher(BATCH_MAX, BATCH_TIMEOUT_MS / 1000)
+# One thread per model, for backends whose forward blocks the calling thread
+_forward_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="forward")
+
+
+def dual_inference(img_tensor, key_v5, key_v7):
+    """
+    Run both models on an image through the batcher and build the response data:
+    each model's result under its key, plus "analysis" holding the more confident
+    successful result. "analysis" is missing if both models failed.
+    """
+    results = {}
+    results[key_v5], results[key_v7] = batcher.submit(img_tensor)
+
+    # Decide which analysis to report (based on higher confidence)
+    if ('error' not in results[key_v5]) and ('error' not in results[key_v7]):
+        if results[key_v5]['confidence'] > results[key_v7]['confidence']:
+            results['analysis'] = {**results[key_v5], "model": "YOLOv5"}
+        else:
+            results['analysis'] = {**results[key_v7], "model": "YOLOv7"}
+    elif 'error' not in results[key_v5]:
+        results['analysis'] = {**results[key_v5], "model": "YOLOv5"}
+    elif 'error' not in results[key_v7]:
+        results['analysis'] = {**results[key_v7], "model": "YOLOv7"}
+    return results
+
+
+_YOLOV7_NOT_LOADED = {"error": "YOLOv7 model not loaded"}
+
+
+def yolov5_only_inference(img_tensor, key_v5, key_v7):
+    """
+    dual_inference for when only YOLOv5 is loaded (YOLOv7 loading is disabled by
+    default): its result is the analysis as-is, with no confidence comparison.
+    """
+    result = batcher.submit(img_tensor)[0]
+    results = {key_v5: result, key_v7: _YOLOV7_NOT_LOADED}
+    if 'error' not in result:
+        results['analysis'] = {**result, "model": "YOLOv5"}
+    return results
+
+
+# The routes' inference function, chosen by select_inference once models are loaded
+inference = dual_inference
+
+
+def select_inference():
+    """Point inference at the cheapest function that handles the loaded models."""
+    global inference
+    inference = yolov5_only_inference if yolov5_model and not yolov7_model else dual_inference
 
 @app.route('/')
 def index():
-    return jsonify({
+    return jsonr({
         "message": "Sentinel Plant Disease Detection API (Flask with YOLOv5)",
         "version": "1.0.0",
         "endpoints": {
@@ -265,14 +1096,19 @@ def index():
 @app.route('/health')
 def health_check():
     """Check if models are loaded and API is functioning."""
+    timings = list(_inference_times)
     status = {
         "status": "operational",
         "models": {
             "yolov5": yolov5_model is not None,
             "yolov7": yolov7_model is not None
+        },
+        "inference": {
+            "batches": timings[-1][0] + 1 if timings else 0,
+            "avgBatchMs": 1000 * sum(t for _, t in timings) / len(timings) if timings else None
         }
     }
-    return jsonify(status)
+    return jsonr(status)
 
 
 @app.route('/analyze', methods=['POST'])
@@ -280,82 +1116,46 @@ def analyze_image():
     """Process uploaded image file."""
     try:
         if 'image' not in request.files:
-            return jsonify({
+            return jsonr({
                 "success": False,
                 "message": "No image file uploaded"
-            }), 400
+            }, 400)
 
         file = request.files['image']
         if file.filename == '':
-            return jsonify({
+            return jsonr({
                 "success": False,
                 "message": "No file selected"
-            }), 400
-        if not allowed_file(file.filename):
-            return jsonify({
+            }, 400)
+        head = file.stream.read(8)
+        file.stream.seek(0)
+        if sniff_image_type(head) is None:
+            return jsonr({
                 "success": False,
                 "message": "File type not allowed. Please upload an image (png, jpg, jpeg)"
-            }), 400
+            }, 400)
 
-        # Save the file
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
 
-        # Preprocess the image
+        # Decode the upload in memory instead of round-tripping it through disk
         try:
-            image_tensor = preprocess_image(image_path=filepath)
+            image_tensor = preprocess_image(image_data=file.read())
         except Exception as e:
-            return jsonify({
+            return jsonr({
                 "success": False,
                 "message": f"Error preprocessing image: {str(e)}"
-            }), 500
-
-        # Run inference with YOLOv5
-        results = {}
-        try:
-            if yolov5_model:
-                results['yolov5Analysis'] = run_inference(yolov5_model, image_tensor)
-            else:
-                results['yolov5Analysis'] = {"error": "YOLOv5 model not loaded"}
-        except Exception as e:
-            logger.error(f"YOLOv5 inference error: {str(e)}")
-            results['yolov5Analysis'] = {"error": f"YOLOv5 inference failed: {str(e)}"}
+            }, 500)
 
-        # (Optional) YOLOv7 inference block if available...
-        try:
-            if yolov7_model:
-                results['yolov7Analysis'] = run_inference(yolov7_model, image_tensor)
-            else:
-                results['yolov7Analysis'] = {"error": "YOLOv7 model not loaded"}
-        except Exception as e:
-            logger.error(f"YOLOv7 inference error: {str(e)}")
-            results['yolov7Analysis'] = {"error": f"YOLOv7 inference failed: {str(e)}"}
-
-        # Decide which analysis to report (based on higher confidence)
-        if ('error' not in results.get('yolov5Analysis', {})) and ('error' not in results.get('yolov7Analysis', {})):
-            if results['yolov5Analysis']['confidence'] > results['yolov7Analysis']['confidence']:
-                results['analysis'] = {**results['yolov5Analysis'], "model": "YOLOv5"}
-            else:
-                results['analysis'] = {**results['yolov7Analysis'], "model": "YOLOv7"}
-        elif 'error' not in results.get('yolov5Analysis', {}):
-            results['analysis'] = {**results['yolov5Analysis'], "model": "YOLOv5"}
-        elif 'error' not in results.get('yolov7Analysis', {}):
-            results['analysis'] = {**results['yolov7Analysis'], "model": "YOLOv7"}
-        else:
-            return jsonify({
+        # Run inference with both models (batched with concurrent requests)
+        results = inference(image_tensor, 'yolov5Analysis', 'yolov7Analysis')
+        if 'analysis' not in results:
+            return jsonr({
                 "success": False,
                 "message": "Both models failed to process the image",
                 "data": results
-            }), 500
-
-        # Remove the file after processing
-        try:
-            os.remove(filepath)
-        except Exception as e:
-            logger.warning(f"Error removing temporary file: {str(e)}")
+            }, 500)
 
-        return jsonify({
+        return jsonr({
             "success": True,
             "data": results,
             "filename": filename
@@ -363,76 +1163,80 @@ def analyze_image():
 
     except Exception as e:
         logger.error(f"Error processing image: {str(e)}")
-        return jsonify({"success": False, "message": f"Error processing image: {str(e)}"}), 500
+        return jsonr({"success": False, "message": f"Error processing image: {str(e)}"}, 500)
 
 
 @app.route('/stream', methods=['POST'])
 def process_stream():
-    """Process image data from camera stream (base64)."""
+    """
+    Process a camera stream frame, sent as raw bytes (application/octet-stream),
+    a multipart 'image' file, or JSON with base64 'imageData' (optionally a data URL).
+    """
     try:
-        data = request.get_json()
-        if not data or 'imageData' not in data:
-            return jsonify({"success": False, "message": "No image data provided"}), 400
+        if request.mimetype == 'application/octet-stream':
+            image_binary = request.get_data()
+        elif 'image' in request.files:
+            image_binary = request.files['image'].read()
+        else:
+            data = request.get_json(silent=True)
+            if not data or 'imageData' not in data:
+                return jsonr({"success": False, "message": "No image data provided"}, 400)
 
-        image_data = data['imageData']
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        image_binary = base64.b64decode(image_data)
+            # Encode once and decode through a memoryview, so stripping the data URL
+            # prefix does not copy the (often multi-megabyte) payload again
+            image_data = data['imageData'].encode('ascii')
+            start = image_data.find(b',') + 1 if image_data.startswith(b'data:image/') else 0
+            image_binary = binascii.a2b_base64(memoryview(image_data)[start:])
+
+        if not image_binary:
+            return jsonr({"success": False, "message": "No image data provided"}, 400)
 
         # Preprocess the image from raw bytes
         try:
             image_tensor = preprocess_image(image_data=image_binary)
         except Exception as e:
-            return jsonify({"success": False, "message": f"Error preprocessing image: {str(e)}"}), 500
+            return jsonr({"success": False, "message": f"Error preprocessing image: {str(e)}"}, 500)
 
-        # Run inference with YOLOv5
-        results = {}
-        try:
-            if yolov5_model:
-                results['yolov5Prediction'] = run_inference(yolov5_model, image_tensor)
-            else:
-                results['yolov5Prediction'] = {"error": "YOLOv5 model not loaded"}
-        except Exception as e:
-            logger.error(f"YOLOv5 inference error: {str(e)}")
-            results['yolov5Prediction'] = {"error": f"YOLOv5 inference failed: {str(e)}"}
+        # Consecutive camera frames are usually near-identical: reuse a recent result
+        client = request.remote_addr
+        image_hash = perceptual_hash(image_tensor)
+        cached = lookup_stream_cache(client, image_hash)
+        if cached is not None:
+            return jsonr({"success": True, "data": cached})
 
-        # YOLOv7 (optional)
-        try:
-            if yolov7_model:
-                results['yolov7Prediction'] = run_inference(yolov7_model, image_tensor)
-            else:
-                results['yolov7Prediction'] = {"error": "YOLOv7 model not loaded"}
-        except Exception as e:
-            logger.error(f"YOLOv7 inference error: {str(e)}")
-            results['yolov7Prediction'] = {"error": f"YOLOv7 inference failed: {str(e)}"}
-
-        # Determine final analysis based on higher confidence
-        if ('error' not in results.get('yolov5Prediction', {})) and (
-                'error' not in results.get('yolov7Prediction', {})):
-            if results['yolov5Prediction']['confidence'] > results['yolov7Prediction']['confidence']:
-                results['analysis'] = {**results['yolov5Prediction'], "model": "YOLOv5"}
-            else:
-                results['analysis'] = {**results['yolov7Prediction'], "model": "YOLOv7"}
-        elif 'error' not in results.get('yolov5Prediction', {}):
-            results['analysis'] = {**results['yolov5Prediction'], "model": "YOLOv5"}
-        elif 'error' not in results.get('yolov7Prediction', {}):
-            results['analysis'] = {**results['yolov7Prediction'], "model": "YOLOv7"}
-        else:
-            return jsonify({
+        # Run inference with both models (batched with concurrent requests)
+        results = inference(image_tensor, 'yolov5Prediction', 'yolov7Prediction')
+        if 'analysis' not in results:
+            return jsonr({
                 "success": False,
                 "message": "Both models failed to process the image",
                 "data": results
-            }), 500
+            }, 500)
 
-        return jsonify({"success": True, "data": results})
+        store_stream_cache(client, image_hash, results)
+        return jsonr({"success": True, "data": results})
 
     except Exception as e:
         logger.error(f"Error processing stream: {str(e)}")
-        return jsonify({"success": False, "message": f"Error in stream processing: {str(e)}"}), 500
+        return jsonr({"success": False, "message": f"Error in stream processing: {str(e)}"}, 500)
 
 
-if __name__ == '__main__':
-    # Load models on startup
+# Refuse the development server before loading, which can export and build engines
+if __name__ == '__main__' and os.environ.get('FLASK_DEV') != '1':
+    logger.error("The Flask development server is disabled; set FLASK_DEV=1 to use it, "
+                 "or run: gunicorn -w 1 --threads 16 -k gthread -b 0.0.0.0:5000 app:app")
+    sys.exit(1)
+
+# Load models once per process at import time so WSGI servers get them too.
+# Production entrypoint (one worker keeps a single copy of the models in GPU memory;
+# request threads mostly wait on the batcher, so more of them lets more
+# concurrent requests coalesce into each batch):
+#   gunicorn -w 1 --threads 16 -k gthread -b 0.0.0.0:5000 app:app
+with app.app_context():
     load_models()
-    # Run the app
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    select_inference()
+
+
+if __name__ == '__main__':
+    # No debug mode: its Werkzeug debugger console would be reachable on every interface
+    app.run(host='0.0.0.0', port=5000)
@@ -30,7 +30,6 @@ REM Create necessary directories
 echo Creating model directories...
 if not exist models\yolov5 mkdir models\yolov5
 if not exist models\yolov7 mkdir models\yolov7
-if not exist uploads mkdir uploads
 
 REM Check for model files
 echo Checking for model files...
@@ -53,16 +52,17 @@ if /i "%start_now%"=="y" (
         echo Starting in production mode with waitress...
         REM If waitress is not installed, install it
         pip install waitress
-        python -m waitress --host=0.0.0.0 --port=5000 app:app
+        python -m waitress --host=0.0.0.0 --port=5000 --threads=16 app:app
     ) else (
         echo Starting in development mode...
+        set FLASK_DEV=1
         python app.py
     )
 ) else (
     echo To start the API later, run:
-    echo venv\Scripts\activate.bat ^&^& python app.py
+    echo venv\Scripts\activate.bat ^&^& set FLASK_DEV=1 ^&^& python app.py
     echo Or for production:
-    echo venv\Scripts\activate.bat ^&^& python -m waitress --host=0.0.0.0 --port=5000 app:app
+    echo venv\Scripts\activate.bat ^&^& python -m waitress --host=0.0.0.0 --port=5000 --threads=16 app:app
 )
 
 echo ======================================
@@ -43,7 +43,6 @@ pip install -r requirements.txt
 echo "Creating model directories..."
 mkdir -p models/yolov
 mkdir -p models/yolov7
-mkdir -p uploads
 
 # Check for model files
 echo "Checking for model files..."
@@ -69,16 +68,16 @@ if [[ $REPLY =~ ^[Yy]$ ]]; then
         if ! command -v gunicorn &> /dev/null; then
             pip install gunicorn
         fi
-        gunicorn -w 4 -b 0.0.0.0:5000 app:app
+        gunicorn -w 1 --threads 16 -k gthread -b 0.0.0.0:5000 app:app
     else
         echo "Starting in development mode..."
-        python app.py
+        FLASK_DEV=1 python app.py
     fi
 else
     echo "To start the API later, run:"
-    echo "source venv/bin/activate && python app.py"
+    echo "source venv/bin/activate && FLASK_DEV=1 python app.py"
     echo "Or for production:"
-    echo "source venv/bin/activate && gunicorn -w 4 -b 0.0.0.0:5000 app:app"
+    echo "source venv/bin/activate && gunicorn -w 1 --threads 16 -k gthread -b 0.0.0.0:5000 app:app"
 fi
 
 echo "======================================"
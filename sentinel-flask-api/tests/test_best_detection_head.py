@@ -0,0 +1,64 @@
+"""
+Check BestDetectionHead against the plain selection it replaces: the candidate with the
+highest objectness x class score, ignoring candidates at or below CONF_THRESHOLD.
+Run from sentinel-flask-api: python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from app import BestDetectionHead, CONF_THRESHOLD  # noqa: E402
+
+
+def reference_best(predictions, conf_threshold=CONF_THRESHOLD):
+    """max(obj * cls) over every candidate and class, as one (class, score) row per image."""
+    predictions = predictions.float()
+    objectness = predictions[..., 4:5]                                  # [N, 25200, 1]
+    scores = objectness * predictions[..., 5:]                          # [N, 25200, 9]
+    scores = scores.masked_fill(objectness <= conf_threshold, 0.0)
+    rows = []
+    for image_scores in scores:
+        best_score = image_scores.max()
+        if best_score <= 0:
+            rows.append((-1.0, 0.0))
+            continue
+        best_class = int(image_scores.argmax()) % image_scores.shape[1]
+        rows.append((float(best_class), float(best_score)))
+    return torch.tensor(rows)
+
+
+class BestDetectionHeadTest(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.head = BestDetectionHead().eval()
+
+    def test_matches_reference_on_random_predictions(self):
+        predictions = torch.rand(4, 25200, 14)
+        torch.testing.assert_close(self.head(predictions), reference_best(predictions))
+
+    def test_matches_reference_in_half_precision(self):
+        predictions = torch.rand(2, 25200, 14).half()
+        torch.testing.assert_close(self.head(predictions), reference_best(predictions))
+
+    def test_many_confident_candidates_do_not_hide_the_best_score(self):
+        # Objectness alone must not pick the winner: 1000 rows at 0.9 x 0.1 lose to 0.89 x 0.99
+        predictions = torch.zeros(1, 25200, 14)
+        predictions[0, :1000, 4] = 0.9
+        predictions[0, :1000, 5] = 0.1
+        predictions[0, 1000, 4] = 0.89
+        predictions[0, 1000, 7] = 0.99
+        torch.testing.assert_close(self.head(predictions), torch.tensor([[2.0, 0.89 * 0.99]]))
+
+    def test_below_threshold_image_reports_no_class(self):
+        predictions = torch.rand(3, 25200, 14)
+        predictions[1, :, 4] = CONF_THRESHOLD * torch.rand(25200)
+        best = self.head(predictions)
+        torch.testing.assert_close(best[1], torch.tensor([-1.0, 0.0]))
+        torch.testing.assert_close(best, reference_best(predictions))
+
+
+if __name__ == '__main__':
+    unittest.main()